@@ -45,7 +45,7 @@ from npt.formatter_simple     import SimpleFormatter
 from npt.loader               import InputFile, load_file
 from npt.parser_asciidiagrams import AsciiDiagramsParser
 from pathlib                  import Path
-from typing                   import Any, Optional, List, Tuple, Union, cast
+from typing                   import Any, Optional, List, Set, Tuple, Union, cast
 from urllib.parse             import urlparse
 
 
@@ -58,68 +58,67 @@ class DTDResolver(lxml.etree.Resolver):
 
 # Protocol DFS
 
-def dfs_struct(struct: npt.protocol.Struct, type_names:List[str]) -> None:
+def dfs_struct(struct: npt.protocol.Struct, type_names:List[str], seen:Set[str]) -> None:
     for field in struct.get_fields():
-        dfs_protocoltype(field.field_type, type_names)
+        dfs_protocoltype(field.field_type, type_names, seen)
 
-def dfs_array(array: npt.protocol.Array, type_names:List[str]) -> None:
-    dfs_protocoltype(array.element_type, type_names)
-    #dfs_protocoltype(array.parse_from, type_names)
-    #dfs_protocoltype(array.serialise_to, type_names)
+def dfs_array(array: npt.protocol.Array, type_names:List[str], seen:Set[str]) -> None:
+    dfs_protocoltype(array.element_type, type_names, seen)
+    #dfs_protocoltype(array.parse_from, type_names, seen)
+    #dfs_protocoltype(array.serialise_to, type_names, seen)
 
-def dfs_enum(enum: npt.protocol.Enum, type_names:List[str]) -> None:
+def dfs_enum(enum: npt.protocol.Enum, type_names:List[str], seen:Set[str]) -> None:
     for variant in enum.variants:
-        dfs_protocoltype(variant, type_names)
-    #dfs_protocoltype(enum.parse_from, type_names)
-    #dfs_protocoltype(enum.serialise_to, type_names)
+        dfs_protocoltype(variant, type_names, seen)
+    #dfs_protocoltype(enum.parse_from, type_names, seen)
+    #dfs_protocoltype(enum.serialise_to, type_names, seen)
 
-def dfs_function(function: npt.protocol.Function, type_names:List[str]) -> None:
+def dfs_function(function: npt.protocol.Function, type_names:List[str], seen:Set[str]) -> None:
     for parameter in function.parameters:
-        if not isinstance(parameter.param_type, npt.protocol.TypeVariable) and isinstance(parameter.param_type, npt.protocol.ConstructableType) and parameter.param_type.name not in type_names:
-            dfs_protocoltype(parameter.param_type, type_names)
-    if not isinstance(function.return_type, npt.protocol.TypeVariable) and isinstance(function.return_type, npt.protocol.ConstructableType) and function.return_type.name not in type_names:
-        dfs_protocoltype(function.return_type, type_names)
+        if not isinstance(parameter.param_type, npt.protocol.TypeVariable):
+            dfs_protocoltype(parameter.param_type, type_names, seen)
+    if not isinstance(function.return_type, npt.protocol.TypeVariable):
+        dfs_protocoltype(function.return_type, type_names, seen)
 
-def dfs_context(context: npt.protocol.Context, type_names:List[str]) -> None:
+def dfs_context(context: npt.protocol.Context, type_names:List[str], seen:Set[str]) -> None:
     for field in context.get_fields():
-        dfs_protocoltype(field.field_type, type_names)
+        dfs_protocoltype(field.field_type, type_names, seen)
 
-def dfs_protocoltype(pt: Union[None, npt.protocol.Function, npt.protocol.ProtocolType], type_names:List[str]) -> None:
+def dfs_protocoltype(pt: Union[None, npt.protocol.Function, npt.protocol.ProtocolType], type_names:List[str], seen:Set[str]) -> None:
+    if isinstance(pt, npt.protocol.ConstructableType):
+        if pt.name in seen:
+            return
+        seen.add(pt.name)
     if isinstance(pt, npt.protocol.BitString):
         type_names.append(pt.name)
     elif isinstance(pt, npt.protocol.Struct):
-        dfs_struct(pt, type_names)
+        dfs_struct(pt, type_names, seen)
         type_names.append(pt.name)
     elif isinstance(pt, npt.protocol.Array):
-        dfs_array(pt, type_names)
+        dfs_array(pt, type_names, seen)
         type_names.append(pt.name)
     elif isinstance(pt, npt.protocol.Enum):
-        dfs_enum(pt, type_names)
+        dfs_enum(pt, type_names, seen)
         type_names.append(pt.name)
     elif isinstance(pt, npt.protocol.Function):
-        dfs_function(pt, type_names)
+        dfs_function(pt, type_names, seen)
         type_names.append(pt.name)
     elif isinstance(pt, npt.protocol.Context):
-        dfs_context(pt, type_names)
+        dfs_context(pt, type_names, seen)
         type_names.append(pt.name)
     elif pt is None:
         return
 
 def dfs_protocol(protocol: npt.protocol.Protocol) -> List[str]:
     type_names : List[str] = []
+    seen       : Set[str]  = set()
 
     for pdu_name in protocol.get_pdu_names():
-        dfs_protocoltype(protocol.get_pdu(pdu_name), type_names)
+        dfs_protocoltype(protocol.get_pdu(pdu_name), type_names, seen)
 
-    dfs_protocoltype(protocol.get_context(), type_names)
+    dfs_protocoltype(protocol.get_context(), type_names, seen)
 
-    type_names_dedupe = []
-
-    for type_name in type_names:
-        if type_name not in type_names_dedupe:
-            type_names_dedupe.append(type_name)
-
-    return type_names_dedupe
+    return type_names
 
 
 
@@ -172,10 +171,7 @@ def main():
                 size_expr = expr_traversal.dfs_expression(cast(npt.protocol.Expression, pt.size))
                 formatter.format_bitstring(pt, size_expr)
             elif isinstance(pt, npt.protocol.Struct):
-                constraints = []
-                for constraint in pt.constraints:
-                    expr = expr_traversal.dfs_expression(constraint)
-                    constraints.append(expr)
+                constraints = [expr_traversal.dfs_expression(constraint) for constraint in pt.constraints]
                 formatter.format_struct(pt, constraints)
             elif isinstance(pt, npt.protocol.Array):
                 formatter.format_array(pt)
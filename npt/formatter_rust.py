@@ -32,6 +32,7 @@ import itertools
 
 from string  import ascii_letters
 from pathlib import Path
+from typing  import Set
 
 from npt.protocol  import *
 from npt.formatter import Formatter
@@ -48,11 +49,13 @@ class RustFormatter(Formatter):
     """
 
     output: List[str]
+    defined_types: Set[str]
     expr_traversal: ExpressionTraversal
 
     #add necessary imports at the start of every generated rust file
     def __init__(self):
         self.output = []
+        self.defined_types = set()
         self.structs = {}
         self.struct_field_signatures = {}
         self.expr_traversal = ExpressionTraversal(self)
@@ -131,7 +134,8 @@ class RustFormatter(Formatter):
             size = re.sub(r"self\(([\w]*)\)", r"\1", size)
             self.struct_field_signatures[f"parse_{bitstring.name.lower()}"] = self_vars
             required_vars = [f"{var_name}: usize" for var_name in self_vars]
-        assert bitstring.name not in self.output
+        assert bitstring.name not in self.defined_types
+        self.defined_types.add(bitstring.name)
         self.output.append(f"\n// Structure and parser for {bitstring.name} (bitstring type)\n")
         self.output.append("\n#[derive(Clone, Debug, PartialEq, Eq)]\n")
         self.output.extend(["pub struct ", camelcase(bitstring.name), "(pub %s);\n" % (data_type)])
@@ -177,62 +181,64 @@ class RustFormatter(Formatter):
         else:
             return 128
 
-    def format_struct_field(self, index: int, struct_name: str, field_names: List[str], parser_func_names: List[str], constraints, presence_constraints):
-        args = []
-        if parser_func_names[index] in self.struct_field_signatures:
-            args = [f"{arg}.0 as usize" for arg in self.struct_field_signatures[parser_func_names[index]]]
-        indentation = "    "*(index+1) + "    "*(index)
+    def format_struct_field(self, struct_name: str, field_names: List[str], parser_func_names: List[str], constraints, presence_constraints):
         generated_code = []
-
-        # process constraints: find those that can be expressed here
-        handled_constraints = []
-        unhandled_constraints = []
-        for constraint in constraints:
-            if all(field in field_names[:index+1] for field in constraint[1]):
-                constraint_expr = constraint[0]
-                for field in constraint[1]:
-                    if field == field_names[index]:
-                        constraint_expr = constraint_expr.replace(field, "o.0")
-                    else:
-                        constraint_expr = constraint_expr.replace(field, f"{field}.0")
-                handled_constraints.append((constraint_expr, constraint[0]))
+        for index in range(len(field_names)):
+            args = []
+            if parser_func_names[index] in self.struct_field_signatures:
+                args = [f"{arg}.0 as usize" for arg in self.struct_field_signatures[parser_func_names[index]]]
+
+            # process constraints: find those that can be expressed here
+            handled_constraints = []
+            unhandled_constraints = []
+            for constraint in constraints:
+                if all(field in field_names[:index+1] for field in constraint[1]):
+                    constraint_expr = constraint[0]
+                    for field in constraint[1]:
+                        if field == field_names[index]:
+                            constraint_expr = constraint_expr.replace(field, "o.0")
+                        else:
+                            constraint_expr = constraint_expr.replace(field, f"{field}.0")
+                    handled_constraints.append((constraint_expr, constraint[0]))
+                else:
+                    unhandled_constraints.append(constraint)
+
+
+            if presence_constraints == None or presence_constraints[index] != "True":
+                presence_constraints[index] = re.sub(r"self\(([\w]*)\)", r"\1.0", presence_constraints[index])
+                if presence_constraints[index][0] == "(" and presence_constraints[index][-1] == ")":
+                    presence_constraints[index] = presence_constraints[index][1:-1]
+                presence_constraint = f"if {presence_constraints[index]} {{ Some("
+                presence_else = "}) } else { None ";
             else:
-                unhandled_constraints.append(constraint)
-
-
-        if presence_constraints == None or presence_constraints[index] != "True":
-            presence_constraints[index] = re.sub(r"self\(([\w]*)\)", r"\1.0", presence_constraints[index])
-            if presence_constraints[index][0] == "(" and presence_constraints[index][-1] == ")":
-                presence_constraints[index] = presence_constraints[index][1:-1]
-            presence_constraint = f"if {presence_constraints[index]} {{ Some("
-            presence_else = "}) } else { None ";
-        else:
-            presence_constraint = ""
-            presence_else = ""
-        constraint_code = "\n" + "\n".join([f"            // check constraint: {constraint[1]}\n            if !({constraint[0]}) {{\n                return (IResult::Err(Err::Error((input, ErrorKind::NonEmpty))), c);\n            }};" for constraint in handled_constraints]) + "\n"
-        if len(args) > 0:
-            generated_code.append(f"    let {field_names[index]} = {presence_constraint}match {parser_func_names[index]}(input, context, {', '.join(args)}) {{\n")
-        else:
-            generated_code.append(f"    let {field_names[index]} = {presence_constraint}match {parser_func_names[index]}(input, context) {{\n")
-        if len(handled_constraints) > 0:
-            generated_code.append(f"        (IResult::Ok((i, o)), c) => {{{constraint_code}            input = i;\n")
-            generated_code.append(f"            context = c;\n")
-            generated_code.append(f"            o\n")
-            generated_code.append(f"        }},\n")
-        else:
-            generated_code.append("        (IResult::Ok((i, o)), c) => {\n");
-            generated_code.append("            input = i;\n");
-            generated_code.append("            context = c;\n");
-            generated_code.append("            o\n")
-            generated_code.append("        }\n")
-        generated_code.append("        (IResult::Err(e), c) => return (IResult::Err(e), c),\n")
-        generated_code.append(f"    {presence_else}}};\n\n")
-        if index+1 < len(field_names):
-            generated_code = generated_code + self.format_struct_field(index+1, struct_name, field_names, parser_func_names, unhandled_constraints, presence_constraints)
+                presence_constraint = ""
+                presence_else = ""
+            constraint_code = "\n" + "\n".join([f"            // check constraint: {constraint[1]}\n            if !({constraint[0]}) {{\n                return (IResult::Err(Err::Error((input, ErrorKind::NonEmpty))), c);\n            }};" for constraint in handled_constraints]) + "\n"
+            if len(args) > 0:
+                generated_code.append(f"    let {field_names[index]} = {presence_constraint}match {parser_func_names[index]}(input, context, {', '.join(args)}) {{\n")
+            else:
+                generated_code.append(f"    let {field_names[index]} = {presence_constraint}match {parser_func_names[index]}(input, context) {{\n")
+            if len(handled_constraints) > 0:
+                generated_code.append(f"        (IResult::Ok((i, o)), c) => {{{constraint_code}            input = i;\n")
+                generated_code.append(f"            context = c;\n")
+                generated_code.append(f"            o\n")
+                generated_code.append(f"        }},\n")
+            else:
+                generated_code.append("        (IResult::Ok((i, o)), c) => {\n");
+                generated_code.append("            input = i;\n");
+                generated_code.append("            context = c;\n");
+                generated_code.append("            o\n")
+                generated_code.append("        }\n")
+            generated_code.append("        (IResult::Err(e), c) => return (IResult::Err(e), c),\n")
+            generated_code.append(f"    {presence_else}}};\n\n")
+
+            # constraints not expressible at this field are retried at the next one
+            constraints = unhandled_constraints
         return generated_code
 
     def format_struct(self, struct: Struct, constraints: List[str]):
-        assert struct.name not in self.output
+        assert struct.name not in self.defined_types
+        self.defined_types.add(struct.name)
         # process constraints - pick out field names and build structure
         processed_constraints = []
         for constraint in constraints:
@@ -261,7 +267,7 @@ class RustFormatter(Formatter):
         self.output.append("}\n")
         self.output.extend(["\n#[inline]"])
         self.output.append("\npub fn parse_{fname}<'a>(mut input: (&'a [u8], usize), mut context: &'a mut Context) -> (IResult<(&'a [u8], usize), {typename}>, &'a mut Context) {{\n".format(fname=struct.name.replace(" ", "_").replace("-", "_").lower(),typename=camelcase(struct.name)))
-        self.output += self.format_struct_field(0, camelcase(struct.name), field_names, parser_functions, processed_constraints, presence_constraints)
+        self.output += self.format_struct_field(camelcase(struct.name), field_names, parser_functions, processed_constraints, presence_constraints)
         self.output.append(f"    (IResult::Ok((\n")
         self.output.append(f"        input,\n")
         self.output.append(f"        {camelcase(struct.name)} {{\n")
@@ -274,7 +280,8 @@ class RustFormatter(Formatter):
         self.struct_field_signatures = {}
 
     def format_array(self, array: Array):
-        assert array.name not in self.output
+        assert array.name not in self.defined_types
+        self.defined_types.add(array.name)
         fname = array.name.replace(" ", "_").replace("-", "_").lower()
         element_type_name = array.element_type.name if isinstance(array.element_type, ConstructableType) else "nothing"
         self.output.append(f"\n// Structure and parser for {array.name}\n")
@@ -332,11 +339,6 @@ class RustFormatter(Formatter):
 
     def format_enum(self, enum:Enum):
         func_name = enum.name.replace(" ", "_").replace("-", "_").lower()
-        self.output.append(f"\n// Parse enum `{enum.name}`\n")
-        self.output.append("\n#[derive(Clone, Debug, PartialEq, Eq)]")
-        self.output.append(f"\npub enum {camelcase(enum.name)} {{\n")
-        self.output.append("\n".join([f"    {camelcase(variant.name)}({camelcase(variant.name)})," for variant in enum.variants if isinstance(variant, ConstructableType)]))
-        self.output.append("\n}\n\n")
         parse_funcs = []
         type_names = []
         for variant in enum.variants:
@@ -344,14 +346,20 @@ class RustFormatter(Formatter):
                 type_names.append(camelcase(variant.name))
                 parse_func_name = variant.name.replace(" ", "_").replace("-", "_").lower()
                 parse_funcs.append(f"parse_{parse_func_name}")
+        self.output.append(f"\n// Parse enum `{enum.name}`\n")
+        self.output.append("\n#[derive(Clone, Debug, PartialEq, Eq)]")
+        self.output.append(f"\npub enum {camelcase(enum.name)} {{\n")
+        self.output.append("\n".join([f"    {type_name}({type_name})," for type_name in type_names]))
+        self.output.append("\n}\n\n")
         self.output.extend(["\n#[inline]"])
         self.output.append(f"pub fn parse_{func_name}<'a>(input: (&'a [u8], usize), mut context: &'a mut Context) -> (IResult<(&'a [u8], usize), {camelcase(enum.name)}>, &'a mut Context) {{\n")
-        self.output += self.format_enum_variants(camelcase(enum.name), 0, parse_funcs, type_names)
+        self.output += self.format_enum_variants(camelcase(enum.name), parse_funcs, type_names)
         self.output.append("    (IResult::Err(Err::Error((input, ErrorKind::NonEmpty))), context)\n")
         self.output.append("}\n")
 
     def format_function(self, function:Function):
-        assert function.name not in self.output
+        assert function.name not in self.defined_types
+        self.defined_types.add(function.name)
         self.output.append("\nfn {function_name}(".format(function_name=function.name))
         for param in function.parameters:
             #TODO: handle parameters which aren't just structs
@@ -379,39 +387,35 @@ class RustFormatter(Formatter):
         context_output += ",\n".join(fields_output) + "\n}\n"
         self.output = [context_output] + self.output
 
-    def format_pdu_variants(self, container_name: str, index: int, parser_func_names: List[str], type_names: List[str]):
+    def format_pdu_variants(self, container_name: str, parser_func_names: List[str], type_names: List[str]):
         generated_code = []
-        generated_code.append(f"    match {parser_func_names[index]}(input, context) {{\n")
-        generated_code.append(f"        (IResult::Ok((([], 0), o)), c) => return (IResult::Ok(((&[], 0), {container_name}::{type_names[index]}(o))), c),\n")
-        generated_code.append(f"        (IResult::Ok(_), c) | (IResult::Err(_), c) => {{ context = c; }}\n    }}\n\n")
-
-        if index+1 < len(parser_func_names):
-            generated_code = generated_code + self.format_pdu_variants(container_name, index+1, parser_func_names, type_names)
+        for index in range(len(parser_func_names)):
+            generated_code.append(f"    match {parser_func_names[index]}(input, context) {{\n")
+            generated_code.append(f"        (IResult::Ok((([], 0), o)), c) => return (IResult::Ok(((&[], 0), {container_name}::{type_names[index]}(o))), c),\n")
+            generated_code.append(f"        (IResult::Ok(_), c) | (IResult::Err(_), c) => {{ context = c; }}\n    }}\n\n")
         return generated_code
 
-    def format_enum_variants(self, container_name: str, index: int, parser_func_names: List[str], type_names: List[str]):
+    def format_enum_variants(self, container_name: str, parser_func_names: List[str], type_names: List[str]):
         generated_code = []
-        generated_code.append(f"    match {parser_func_names[index]}(input, context) {{\n")
-        generated_code.append(f"        (IResult::Ok((i, o)), c) => return (IResult::Ok((i, {container_name}::{type_names[index]}(o))), c),\n")
-        generated_code.append(f"        (IResult::Err(_), c) =>  {{ context = c; }}\n    }}\n\n")
-
-        if index+1 < len(parser_func_names):
-            generated_code = generated_code + self.format_enum_variants(container_name, index+1, parser_func_names, type_names)
+        for index in range(len(parser_func_names)):
+            generated_code.append(f"    match {parser_func_names[index]}(input, context) {{\n")
+            generated_code.append(f"        (IResult::Ok((i, o)), c) => return (IResult::Ok((i, {container_name}::{type_names[index]}(o))), c),\n")
+            generated_code.append(f"        (IResult::Err(_), c) =>  {{ context = c; }}\n    }}\n\n")
         return generated_code
 
     def format_protocol(self, protocol: Protocol):
-        self.output.append("\n// Parse incoming PDUs\n")
-        self.output.append("\n#[derive(Clone, Debug, PartialEq, Eq)]")
-        self.output.append("\npub enum PDU {\n")
-        self.output.append("\n".join([f"    {camelcase(pdu_name)}({camelcase(pdu_name)})," for pdu_name in protocol.get_pdu_names()]))
-        self.output.append("\n}\n\n")
         parse_funcs = []
         type_names = []
         for pdu_name in protocol.get_pdu_names():
             type_names.append(camelcase(pdu_name))
             parse_funcs.append(f"parse_{pdu_name.replace(' ', '_').replace('-', '_').lower()}")
+        self.output.append("\n// Parse incoming PDUs\n")
+        self.output.append("\n#[derive(Clone, Debug, PartialEq, Eq)]")
+        self.output.append("\npub enum PDU {\n")
+        self.output.append("\n".join([f"    {type_name}({type_name})," for type_name in type_names]))
+        self.output.append("\n}\n\n")
         self.output.extend(["#[inline]\n"])
         self.output.append("pub fn parse_pdu<'a>(input: (&'a [u8], usize), mut context: &'a mut Context) -> (IResult<(&'a [u8], usize), PDU>, &'a mut Context) {\n")
-        self.output += self.format_pdu_variants("PDU", 0, parse_funcs, type_names)
+        self.output += self.format_pdu_variants("PDU", parse_funcs, type_names)
         self.output.append("    (IResult::Err(Err::Error((input, ErrorKind::NonEmpty))), context)")
         self.output.append("\n}")
@@ -28,7 +28,7 @@
 # SPDX-License-Identifier: BSD-2-Clause
 # =================================================================================================
 
-from typing import Optional, List, Any, cast
+from typing import Optional, List, Any, Callable, Dict, cast
 
 from npt.formatter     import Formatter
 from npt.protocol     import *
@@ -37,29 +37,32 @@ from npt.protocol     import *
 
 class ExpressionTraversal:
     formatter: Formatter
+    handlers: Dict[type, Callable[[Any], Any]]
 
     def __init__(self, formatter: Formatter):
         self.formatter = formatter
+        self.handlers = {
+            ArgumentExpression           : self.dfs_argumentexpression,
+            MethodInvocationExpression   : self.dfs_methodinvocationexpr,
+            FunctionInvocationExpression : self.dfs_functioninvocationexpr,
+            FieldAccessExpression        : self.dfs_fieldaccessexpr,
+            ContextAccessExpression      : self.dfs_contextaccessexpr,
+            IfElseExpression             : self.dfs_ifelseexpr,
+            SelfExpression               : self.dfs_selfexpr,
+            ConstantExpression           : self.dfs_constantexpr,
+        }
     
     def dfs_expression(self, expr: Optional[Expression]) -> Any:
         if expr is None:
             return None
-        if isinstance(expr, ArgumentExpression):
-            return self.dfs_argumentexpression(expr)
-        elif isinstance(expr, MethodInvocationExpression):
-            return self.dfs_methodinvocationexpr(expr)
-        elif isinstance(expr, FunctionInvocationExpression):
-            return self.dfs_functioninvocationexpr(expr)
-        elif isinstance(expr, FieldAccessExpression):
-            return self.dfs_fieldaccessexpr(expr)
-        elif isinstance(expr, ContextAccessExpression):
-            return self.dfs_contextaccessexpr(expr)
-        elif isinstance(expr, IfElseExpression):
-            return self.dfs_ifelseexpr(expr)
-        elif isinstance(expr, SelfExpression):
-            return self.dfs_selfexpr(expr)
-        elif isinstance(expr, ConstantExpression):
-            return self.dfs_constantexpr(expr)
+        handler = self.handlers.get(type(expr))
+        if handler is not None:
+            return handler(expr)
+        # subclasses of the expression types fall back to the first matching handler
+        for expr_type, handler in self.handlers.items():
+            if isinstance(expr, expr_type):
+                return handler(expr)
+        return None
     
     def dfs_argumentexpression(self, expr: ArgumentExpression) -> Any:
         arg_value = self.dfs_expression(expr.arg_value)
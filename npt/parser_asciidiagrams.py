@@ -28,43 +28,173 @@
 # SPDX-License-Identifier: BSD-2-Clause
 # =================================================================================================
 
+import functools
+import hashlib
+import os
 import string
+import sys
+import tempfile
 import parsley
 
+from ometa.builder import moduleFromGrammar, writePython
+from ometa.grammar import OMeta
+from ometa.runtime import OMetaBase
+
 import npt.rfc as rfc
 import npt.protocol
 
 from npt.parser import Parser
-from typing     import cast, Optional, Union, List, Tuple
-
-def stem(phrase):
+from typing     import cast, Any, Callable, Dict, Optional, Union, List, Tuple
+
+# Compiling a grammar is expensive, binding it is not: compiled grammars are cached
+# per (filename, mtime) with the instance-independent GRAMMAR_BINDINGS, and each parser
+# instance binds its own names to a subclass.
+_grammar_cache : Dict[Tuple[str, float], Any] = {}
+
+# The generated source depends on the code generator as well as on the grammar text, so the
+# Parsley version is part of the cache key. Without it (e.g., a vendored copy with no package
+# metadata) the source cannot be keyed safely, and the disk cache is not used.
+GENERATOR_VERSION : Optional[str] = None
+if sys.version_info >= (3, 8):
+    from importlib.metadata import PackageNotFoundError, version as _distribution_version
+    try:
+        GENERATOR_VERSION = _distribution_version("parsley")
+    except PackageNotFoundError:
+        pass
+
+# Parsing the grammar file dominates the compile time, so the Python source that OMeta
+# generates from it is also kept on disk, keyed by a hash of the grammar text and generator.
+# The cache file is replaced atomically so concurrent runs never see a partial write.
+def grammar_source(filename: str, use_cache: bool = True) -> str:
+    with open(filename) as grammarFile:
+        grammar = grammarFile.read()
+    if GENERATOR_VERSION is None:
+        return writePython(OMeta(grammar).parseGrammar("Grammar"), grammar)
+    key    = GENERATOR_VERSION + "\0" + grammar
+    digest = "# " + hashlib.sha256(key.encode("utf-8")).hexdigest() + "\n"
+    cache_dir  = os.path.join(os.path.dirname(filename), "__pycache__")
+    cache_file = os.path.join(cache_dir, os.path.basename(filename) + ".py")
+    if use_cache:
+        try:
+            with open(cache_file) as cacheFile:
+                if cacheFile.readline() == digest:
+                    return cacheFile.read()
+        except OSError:
+            pass
+    source = writePython(OMeta(grammar).parseGrammar("Grammar"), grammar)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmpFile = tempfile.NamedTemporaryFile("w", dir=cache_dir, suffix=".tmp", delete=False)
+        try:
+            with tmpFile:
+                tmpFile.write(digest + source)
+            os.replace(tmpFile.name, cache_file)
+        except BaseException:
+            os.unlink(tmpFile.name)
+            raise
+    except Exception:
+        # The disk cache is only an optimisation: failing to write it is not an error
+        pass
+    return source
+
+def compile_grammar(filename: str, source: str) -> Any:
+    # The generated code does not map onto the grammar file line for line, so it is compiled
+    # under a synthetic name rather than the grammar's own path.
+    module = moduleFromGrammar(source, "Grammar", "pymeta_grammar__Grammar", "<generated from " + os.path.basename(filename) + ">")
+    return module.createParserClass(OMetaBase, dict(GRAMMAR_BINDINGS))
+
+def load_grammar(filename: str, bindings: Dict[str, Any]) -> Any:
+    key = (filename, os.stat(filename).st_mtime)
+    grammar = _grammar_cache.get(key)
+    if grammar is None:
+        try:
+            grammar = compile_grammar(filename, grammar_source(filename))
+        except Exception:
+            grammar = None
+        if grammar is None:
+            # The cached source is unusable (e.g., truncated), so treat it as a miss
+            grammar = compile_grammar(filename, grammar_source(filename, use_cache=False))
+        _grammar_cache[key] = grammar
+    return parsley.wrapGrammar(type(grammar.__name__, (grammar,), {"globals": {**grammar.globals, **bindings}}))
+
+# Every alternative of the paragraph rule contains one of these; anything else is prose
+# and can be skipped without running the parser.
+PARAGRAPH_MARKERS = ("formatted", "function is defined as:", "is one of: ", "is either ",
+                     "is serialised to ", "is parsed from ", "describes")
+
+# Fields sized in these units are plain bit strings; any other unit names a type.
+BYTE_UNITS = frozenset(["byte", "bytes"])
+BIT_UNITS  = frozenset(["bit", "bits", None]) | BYTE_UNITS
+
+PRIMITIVE_TYPES = {
+    "Number"  : npt.protocol.Number,
+    "Boolean" : npt.protocol.Boolean,
+    "Nothing" : npt.protocol.Nothing,
+}
+
+# SelfExpression carries no state, so every reference to "this" can share one instance.
+SELF_EXPRESSION = npt.protocol.SelfExpression()
+
+# A field description without this phrase can never match the context_use rule.
+CONTEXT_USE_MARKER = "On receipt, the value of "
+
+@functools.lru_cache(maxsize=None)
+def stem(phrase: str) -> str:
     if phrase[-1] == 's':
         return phrase[:-1]
     else:
         return phrase
 
+@functools.lru_cache(maxsize=None)
 def valid_field_name_convertor(name):
     if name is not None:
         return name.lower().replace(" ", "_")
     else:
         return None
 
-def valid_type_name_convertor(name):
+@functools.lru_cache(maxsize=None)
+def valid_type_name_convertor(name: str) -> str:
     if name[0].isdigit():
         name = "T" + name
-    name = ' '.join(name.replace('\n',' ').split())
-    return name.capitalize().replace(" ", "_").replace("-", "_")
+    return "_".join(name.split()).capitalize().replace("-", "_")
 
-def resolve_multiline_length(tokens):
+def resolve_multiline_length(tokens: List[Tuple[str, str, int]]) -> Tuple[Union[int, str], str]:
     # scan for variable length
     field = " ".join([ desc for desc, delim, length in tokens if len(desc) > 0 ])
     length = "var"  if len([ delim for desc, delim, length in tokens if delim in [ ':', '...' ]]) > 0 \
                     else max([ length for desc, delim, length in tokens]) * (field.count('\n')+1)
     return ( length , field.strip())
 
+GRAMMAR_FILE = os.path.join(os.path.dirname(__file__), "grammar_asciidiagrams.txt")
+
+GRAMMAR_BINDINGS : Dict[str, Any] = {
+    "ascii_uppercase"          : string.ascii_uppercase,
+    "ascii_lowercase"          : string.ascii_lowercase,
+    "ascii_letters"            : string.ascii_letters,
+    "punctuation"              : string.punctuation,
+    "stem"                     : stem,
+    "resolve_multiline_length" : resolve_multiline_length,
+}
+
 class AsciiDiagramsParser(Parser):
+    paragraphs    : Dict[str, Optional[Tuple[str, Any]]]
+    types         : Dict[str, npt.protocol.ProtocolType]
+    constants     : Dict[Tuple[str, Any], npt.protocol.ConstantExpression]
+    self_accesses : Dict[str, npt.protocol.FieldAccessExpression]
+    expr_builders : Dict[str, Callable[[Tuple, str], Any]]
+
     def __init__(self) -> None:
         super().__init__()
+        # Classification of each distinct paragraph text, or None if it is prose
+        self.paragraphs = {}
+        self.expr_builders = {
+            "contextaccess"    : self.build_contextaccess_expr,
+            "setvalue"         : self.build_setvalue_expr,
+            "const"            : self.build_const_expr,
+            "method"           : self.build_method_expr,
+            "methodinvocation" : self.build_methodinvocation_expr,
+            "fieldaccess"      : self.build_fieldaccess_expr,
+        }
 
     def new_field(self, full_label, short_label, options, size, units, value_constraint, is_present, is_array):
         return {"full_label": valid_field_name_convertor(full_label), "short_label": valid_field_name_convertor(short_label), "options" : options, "size": size, "units": units, "value_constraint": value_constraint, "is_present": is_present, "is_array": is_array}
@@ -98,7 +228,7 @@ class AsciiDiagramsParser(Parser):
         bits = 0
         label = None
         for field in diagram_fields:
-            if field == None:
+            if field is None:
                 continue
             if ':' in field[1]:
                 field = ("var", field[1].replace(':', '').strip())
@@ -119,24 +249,20 @@ class AsciiDiagramsParser(Parser):
         self.functions = {}
         self.serialise_to = {}
         self.parse_from = {}
-        with open("npt/grammar_asciidiagrams.txt") as grammarFile:
-            return parsley.makeGrammar(grammarFile.read(),
-                                   {
-                                     "ascii_uppercase"          : string.ascii_uppercase,
-                                     "ascii_lowercase"          : string.ascii_lowercase,
-                                     "ascii_letters"            : string.ascii_letters,
-                                     "punctuation"              : string.punctuation,
-                                     "new_constant"             : self.new_constant,
-                                     "build_tree"               : self.build_tree,
-                                     "new_fieldaccess"          : self.new_fieldaccess,
-                                     "new_methodinvocation"     : self.new_methodinvocation,
-                                     "new_this"                 : self.new_this,
-                                     "new_field"                : self.new_field,
-                                     "proc_diagram_fields"      : self.proc_diagram_fields,
-                                     "stem"                     : stem,
-                                     "resolve_multiline_length" : resolve_multiline_length,
-                                     "protocol"                 : self.proto
-                                   })
+        self.types = {}
+        self.constants = {}
+        self.self_accesses = {}
+        return load_grammar(GRAMMAR_FILE,
+                               {
+                                 "new_constant"             : self.new_constant,
+                                 "build_tree"               : self.build_tree,
+                                 "new_fieldaccess"          : self.new_fieldaccess,
+                                 "new_methodinvocation"     : self.new_methodinvocation,
+                                 "new_this"                 : self.new_this,
+                                 "new_field"                : self.new_field,
+                                 "proc_diagram_fields"      : self.proc_diagram_fields,
+                                 "protocol"                 : self.proto
+                               })
 
     def process_diagram(self, artwork: str, parser) -> List[Tuple[Union[int, str], str]]:
         delim_units = parser(artwork.strip()).diagram()
@@ -165,131 +291,170 @@ class AsciiDiagramsParser(Parser):
         return fields
 
 
-    def process_section(self, section : rfc.Section, parser, structs):
-        for i in range(len(section.content)):
-            t = section.content[i]
-            if isinstance(t, rfc.T):
-                for j in range(len(t.content)):
-                    inner_t = cast(rfc.Text, t.content[j])
-                    try:
-                        pdu_name = parser(inner_t.content.strip()).preamble()
-                        if isinstance(section.content[i+1], rfc.Figure):
-                            fig = cast(rfc.Figure, section.content[i+1])
-                            artwork = fig.content[0].content
+    def process_section(self, section : rfc.Section, parser):
+        paragraphs = self.paragraphs
+        sections = [section]
+        while len(sections) > 0:
+            section = sections.pop()
+            for i, t in enumerate(section.content):
+                if isinstance(t, rfc.T):
+                    for inner_t in t.content:
+                        try:
+                            text = cast(rfc.Text, inner_t).content.strip()
+                        except Exception as e:
+                            continue
+                        if text in paragraphs:
+                            paragraph = paragraphs[text]
                         else:
-                            artwork = cast(rfc.Artwork, section.content[i+1]).content
-                        artwork_fields = self.process_diagram( cast(rfc.Text, artwork).content, parser)
-                        where = section.content[i+2]
-                        fields = {}
-                        name_map = {}
-                        t_elem : Optional[rfc.T] = None
-                        if len(section.content) >= i+2 and type(section.content[i+2]) == rfc.T:
-                            t_elem = cast(rfc.T, section.content[i+2])
-                        if t_elem is not None and len(t_elem.content) >= 2 and type(t_elem.content[1]) == rfc.List:
-                                rfc_list = t_elem.content[1]
-                                desc_list = rfc_list.content[0].content
-                                for element in desc_list:
-                                    if type(element) is rfc.T:
-                                        t_elem = element
-                                        if t_elem.hangText is not None:
-                                            field = parser(t_elem.hangText.strip()).field_title()
-                                            field["context_field"] = None
-                                            if field["short_label"] is not None:
-                                                name_map[field["short_label"]] = field["full_label"]
-                                            fields[field["full_label"]] = field
-                        elif len(section.content) >= i+3 and isinstance(section.content[i+3], rfc.DL):
-                            desc_list = section.content[i+3] # type: ignore
-                            assert isinstance(desc_list, rfc.DL)
-                            for k in range(len(desc_list.content)):
-                                title, desc = desc_list.content[k]
-                                field = parser(cast(rfc.Text, title.content[0]).content.strip()).field_title()
+                            paragraph = None
+                            if any(marker in text for marker in PARAGRAPH_MARKERS):
                                 try:
-                                    context_field = parser(cast(rfc.Text, desc.content[-1]).content.strip()).context_use()
-                                except:
-                                    context_field = None
-                                field["context_field"] = context_field
-                                if field["short_label"] is not None:
-                                    name_map[field["short_label"]] = field["full_label"]
-                                fields[field["full_label"]] = field
-                        self.structs[valid_type_name_convertor(pdu_name)] = {}
-                        self.structs[valid_type_name_convertor(pdu_name)]["name_map"] = name_map
-                        self.structs[valid_type_name_convertor(pdu_name)]["fields"] = fields
-                    except Exception as e:
-                        pass
-
-                    try:
-                        function_name = parser(inner_t.content.strip()).function()
-                        function_artwork = cast(rfc.Artwork, section.content[i+1])
-                        function_text = cast(rfc.Text, function_artwork.content)
-                        function_def = parser(function_text.content.strip()).function_signature()
-                        self.functions[valid_field_name_convertor(function_name)] = function_def
-                    except Exception as e:
-                        pass
-
-                    try:
-                        enum_name, variants = parser(inner_t.content.strip()).enum()
-                        self.enums[valid_type_name_convertor(enum_name)] = [valid_type_name_convertor(variant) for variant in variants]
-                    except Exception as e:
-                        pass
-
-                    try:
-                        from_type, to_type, func_name = parser(inner_t.content.strip()).serialised_to_func()
-                        self.serialise_to[valid_type_name_convertor(from_type)] = (valid_type_name_convertor(to_type), valid_field_name_convertor(func_name))
-                    except Exception as e:
-                        pass
-
-                    try:
-                        from_type, to_type, func_name = parser(inner_t.content.strip()).parsed_from_func()
-                        self.parse_from[valid_type_name_convertor(from_type)] = (valid_type_name_convertor(to_type), valid_field_name_convertor(func_name))
-                    except Exception as e:
-                        pass
-
-                    try:
-                        protocol_name, pdus = parser(inner_t.content.strip()).protocol_definition()
-                        self.protocol_name = protocol_name
-                        self.pdus = [valid_type_name_convertor(pdu) for pdu in pdus]
-                    except Exception as e:
-                        continue
-        if section.sections is not None:
-            for subsection in section.sections:
-                self.process_section(subsection, parser, structs)
+                                    paragraph = parser(text).paragraph()
+                                except Exception as e:
+                                    pass
+                            paragraphs[text] = paragraph
+                        if paragraph is None:
+                            continue
+                        kind, value = paragraph
+
+                        if kind == "preamble":
+                            try:
+                                pdu_name = value
+                                if isinstance(section.content[i+1], rfc.Figure):
+                                    fig = cast(rfc.Figure, section.content[i+1])
+                                    artwork = fig.content[0].content
+                                else:
+                                    artwork = cast(rfc.Artwork, section.content[i+1]).content
+                                artwork_fields = self.process_diagram( cast(rfc.Text, artwork).content, parser)
+                                where = section.content[i+2]
+                                fields = {}
+                                name_map = {}
+                                t_elem : Optional[rfc.T] = None
+                                if type(where) is rfc.T:
+                                    t_elem = where
+                                if t_elem is not None and len(t_elem.content) >= 2 and type(t_elem.content[1]) is rfc.List:
+                                        rfc_list = t_elem.content[1]
+                                        desc_list = rfc_list.content[0].content
+                                        for element in desc_list:
+                                            if type(element) is rfc.T:
+                                                t_elem = element
+                                                if t_elem.hangText is not None:
+                                                    field = parser(t_elem.hangText.strip()).field_title()
+                                                    field["context_field"] = None
+                                                    if field["short_label"] is not None:
+                                                        name_map[field["short_label"]] = field["full_label"]
+                                                    fields[field["full_label"]] = field
+                                elif len(section.content) >= i+3 and isinstance(section.content[i+3], rfc.DL):
+                                    desc_list = section.content[i+3] # type: ignore
+                                    assert isinstance(desc_list, rfc.DL)
+                                    for k in range(len(desc_list.content)):
+                                        title, desc = desc_list.content[k]
+                                        field = parser(cast(rfc.Text, title.content[0]).content.strip()).field_title()
+                                        context_field = None
+                                        try:
+                                            context_text = cast(rfc.Text, desc.content[-1]).content.strip()
+                                            if CONTEXT_USE_MARKER in context_text:
+                                                context_field = parser(context_text).context_use()
+                                        except:
+                                            context_field = None
+                                        field["context_field"] = context_field
+                                        if field["short_label"] is not None:
+                                            name_map[field["short_label"]] = field["full_label"]
+                                        fields[field["full_label"]] = field
+                                self.structs[valid_type_name_convertor(pdu_name)] = {"name_map": name_map, "fields": fields}
+                            except Exception as e:
+                                pass
+                        elif kind == "function":
+                            try:
+                                function_artwork = cast(rfc.Artwork, section.content[i+1])
+                                function_text = cast(rfc.Text, function_artwork.content)
+                                function_def = parser(function_text.content.strip()).function_signature()
+                                self.functions[valid_field_name_convertor(value)] = function_def
+                            except Exception as e:
+                                pass
+                        elif kind == "enum":
+                            enum_name, variants = value
+                            self.enums[valid_type_name_convertor(enum_name)] = [valid_type_name_convertor(variant) for variant in variants]
+                        elif kind == "serialised_to":
+                            from_type, to_type, func_name = value
+                            self.serialise_to[valid_type_name_convertor(from_type)] = (valid_type_name_convertor(to_type), valid_field_name_convertor(func_name))
+                        elif kind == "parsed_from":
+                            from_type, to_type, func_name = value
+                            self.parse_from[valid_type_name_convertor(from_type)] = (valid_type_name_convertor(to_type), valid_field_name_convertor(func_name))
+                        elif kind == "protocol_definition":
+                            protocol_name, pdus = value
+                            self.protocol_name = protocol_name
+                            self.pdus = [valid_type_name_convertor(pdu) for pdu in pdus]
+            if section.sections is not None:
+                sections.extend(reversed(section.sections))
 
     def build_expr(self, expr, pdu_name):
-        if type(expr) != tuple:
+        if type(expr) is not tuple:
             if expr == "this":
-                return npt.protocol.SelfExpression()
+                return SELF_EXPRESSION
             if type(expr) is not str:
                 return expr
-            return self.structs[pdu_name]["name_map"].get(valid_field_name_convertor(expr), valid_field_name_convertor(expr))
-        elif expr[0] == "contextaccess":
-            return npt.protocol.ContextAccessExpression(self.proto.get_context(), valid_field_name_convertor(expr[1]))
-        elif expr[0] == "setvalue":
-            return npt.protocol.MethodInvocationExpression(self.build_expr(expr[1], pdu_name), "set", [npt.protocol.ArgumentExpression("value", self.build_expr(expr[2], pdu_name))])
-        elif expr[0] == "const":
-            return npt.protocol.ConstantExpression(self.build_type(expr[1]), self.build_expr(expr[2], pdu_name))
-        elif expr[0] == "method":
-            return npt.protocol.MethodInvocationExpression(self.build_expr(expr[1], pdu_name), expr[2], [npt.protocol.ArgumentExpression("other", self.build_expr(expr[3], pdu_name))])
-        elif expr[0] == "methodinvocation":
-            return npt.protocol.MethodInvocationExpression(self.build_expr(expr[1], pdu_name), expr[2], expr[3])
-        elif expr[0] == "fieldaccess":
-            target = self.build_expr(expr[1], pdu_name)
-            if type(target) == npt.protocol.FieldAccessExpression:
-                pdu_name = valid_type_name_convertor(self.structs[pdu_name]["fields"][valid_field_name_convertor(target.field_name)]["units"])
-            return npt.protocol.FieldAccessExpression(target, self.build_expr(expr[2], pdu_name))
+            field_name = valid_field_name_convertor(expr)
+            return self.structs[pdu_name]["name_map"].get(field_name, field_name)
+        build = self.expr_builders.get(expr[0])
+        if build is not None:
+            return build(expr, pdu_name)
+
+    def build_contextaccess_expr(self, expr, pdu_name):
+        return npt.protocol.ContextAccessExpression(self.proto.get_context(), valid_field_name_convertor(expr[1]))
+
+    def build_setvalue_expr(self, expr, pdu_name):
+        return npt.protocol.MethodInvocationExpression(self.build_expr(expr[1], pdu_name), "set", [npt.protocol.ArgumentExpression("value", self.build_expr(expr[2], pdu_name))])
+
+    def build_const_expr(self, expr, pdu_name):
+        return self.build_constant(expr[1], self.build_expr(expr[2], pdu_name))
+
+    def build_constant(self, type_name, value):
+        # Constants are immutable and always numeric or boolean, so equal ones can be shared
+        constant = self.constants.get((type_name, value))
+        if constant is None:
+            constant = npt.protocol.ConstantExpression(self.build_type(type_name), value)
+            self.constants[(type_name, value)] = constant
+        return constant
+
+    def build_method_expr(self, expr, pdu_name):
+        return npt.protocol.MethodInvocationExpression(self.build_expr(expr[1], pdu_name), expr[2], [npt.protocol.ArgumentExpression("other", self.build_expr(expr[3], pdu_name))])
+
+    def build_methodinvocation_expr(self, expr, pdu_name):
+        return npt.protocol.MethodInvocationExpression(self.build_expr(expr[1], pdu_name), expr[2], expr[3])
+
+    def build_fieldaccess_expr(self, expr, pdu_name):
+        target = self.build_expr(expr[1], pdu_name)
+        if type(target) is npt.protocol.FieldAccessExpression:
+            pdu_name = valid_type_name_convertor(self.structs[pdu_name]["fields"][valid_field_name_convertor(target.field_name)]["units"])
+        field_name = self.build_expr(expr[2], pdu_name)
+        if target is not SELF_EXPRESSION:
+            return npt.protocol.FieldAccessExpression(target, field_name)
+        # Accesses to fields of this are immutable too, and far more common than any other
+        field_access = self.self_accesses.get(field_name)
+        if field_access is None:
+            field_access = npt.protocol.FieldAccessExpression(target, field_name)
+            self.self_accesses[field_name] = field_access
+        return field_access
 
     def build_struct(self, struct_name):
         fields = []
         constraints = []
         actions = []
-        for field in self.structs[struct_name]["fields"]:
-            field = self.structs[struct_name]["fields"][field]
+        add_type       = self.proto.add_type
+        build_expr     = self.build_expr
+        build_type     = self.build_type
+        build_constant = self.build_constant
+        for field in self.structs[struct_name]["fields"].values():
+            name = struct_name + "_" + field["full_label"]
             size_expr = None
             ispresent_expr = None
             field_type : Optional[npt.protocol.RepresentableType] = None
-            if field["units"] not in ["bits", "bit", "bytes", "byte", None]:
+            is_bitstring = field["units"] in BIT_UNITS
+            in_bytes     = field["units"] in BYTE_UNITS
+            if not is_bitstring:
                 if field["is_array"]:
-                    name = struct_name + "_" + field["full_label"]
-                    bitsize_expr = self.build_expr(field["value_constraint"], struct_name)
+                    bitsize_expr = build_expr(field["value_constraint"], struct_name)
                     array_size = None
                     if isinstance(bitsize_expr, npt.protocol.MethodInvocationExpression) and \
                        isinstance(bitsize_expr.target, npt.protocol.MethodInvocationExpression) and \
@@ -300,91 +465,80 @@ class AsciiDiagramsParser(Parser):
                        bitsize_expr.method_name == "eq":
                         array_size = bitsize_expr.arg_exprs[0].arg_value
                         field["value_constraint"] = None
-                    field_type = npt.protocol.Array(name, self.build_type(valid_type_name_convertor(field["units"])), None, size=array_size)
-                    self.proto.add_type(field_type)
+                    field_type = npt.protocol.Array(name, build_type(valid_type_name_convertor(field["units"])), None, size=array_size)
+                    add_type(field_type)
                 else:
-                    field_type = self.build_type(valid_type_name_convertor(field["units"]))
+                    field_type = build_type(valid_type_name_convertor(field["units"]))
             if field["size"] is not None:
-                #if field["size"][0] == "methodinvocation" or field["size"][0] == "method":
-                #    size_expr = self.build_expr(("method", field["size"], "eq", ("methodinvocation", ("fieldaccess", "this", field["full_label"]), "size", [])), struct_name)
-                #else:
-                size_expr = self.build_expr(field["size"], struct_name)
+                size_expr = build_expr(field["size"], struct_name)
             if field["value_constraint"] is not None:
-                value_expr = self.build_expr(field["value_constraint"], struct_name)
+                value_expr = build_expr(field["value_constraint"], struct_name)
                 constraints.append(value_expr)
-            if field["units"] in ["bits", "bit", "bytes", "byte", None]:
-                name = struct_name + "_" + field["full_label"]
-                if size_expr is not None and type(size_expr) is npt.protocol.ConstantExpression and field["units"] in ["byte", "bytes"]:
-                    size_expr = self.build_expr(("const", "Number", size_expr.constant_value*8), struct_name)
-                elif size_expr is not None and field["units"] in ["byte", "bytes"]:
-                    size_expr = self.build_expr(("method", size_expr, "multiply", ("const", "Number", 8)), struct_name)
-                if type(size_expr) is npt.protocol.ConstantExpression:
-                    field_type = npt.protocol.BitString(name, size_expr)
-                    self.proto.add_type(field_type)
-                else:
-                    field_type = npt.protocol.BitString(name, size_expr)
-                    self.proto.add_type(field_type)
-                    #if size_expr is not None:
-                    #    constraints.append(size_expr)
+            if is_bitstring:
+                if size_expr is not None and type(size_expr) is npt.protocol.ConstantExpression and in_bytes:
+                    size_expr = build_constant("Number", size_expr.constant_value*8)
+                elif size_expr is not None and in_bytes:
+                    size_expr = npt.protocol.MethodInvocationExpression(size_expr, "multiply", [npt.protocol.ArgumentExpression("other", build_constant("Number", 8))])
+                field_type = npt.protocol.BitString(name, size_expr)
+                add_type(field_type)
             else:
                 if size_expr is not None and not(type(size_expr) is npt.protocol.ConstantExpression and size_expr.constant_value == 1) and isinstance(field_type, npt.protocol.RepresentableType):
-                    field_type = npt.protocol.Array(struct_name + "_" + field["full_label"], field_type, size_expr)
-                    self.proto.add_type(field_type)
+                    field_type = npt.protocol.Array(name, field_type, size_expr)
+                    add_type(field_type)
             if field["is_present"] is not None:
-                ispresent_expr = self.build_expr(field["is_present"], struct_name)
+                ispresent_expr = build_expr(field["is_present"], struct_name)
             else:
-                ispresent_expr = self.build_expr(("const", "Boolean", True), struct_name)
+                ispresent_expr = build_constant("Boolean", True)
             if field["context_field"] is not None:
-                self.proto.get_context().add_field(npt.protocol.ContextField(valid_field_name_convertor(field["context_field"][1]), self.build_type("Number")))
-                action = self.build_expr(("setvalue", ("contextaccess", field["context_field"][1]), field["context_field"][0]), struct_name)
+                self.proto.get_context().add_field(npt.protocol.ContextField(valid_field_name_convertor(field["context_field"][1]), build_type("Number")))
+                action = build_expr(("setvalue", ("contextaccess", field["context_field"][1]), field["context_field"][0]), struct_name)
                 actions.append(action)
             if field_type is not None:
                 struct_field = npt.protocol.StructField(field["full_label"],
                                                 field_type,
                                                 ispresent_expr)
             fields.append(struct_field)
-        struct = self.proto.add_type(npt.protocol.Struct(struct_name, fields, constraints, actions))
+        struct = add_type(npt.protocol.Struct(struct_name, fields, constraints, actions))
         return struct
 
     def build_enum(self, type_name):
-        variants = []
-        for variant in self.enums[type_name]:
-            variants.append(self.build_type(variant))
+        variants = [self.build_type(variant) for variant in self.enums[type_name]]
         enum = self.proto.add_type(npt.protocol.Enum(type_name, variants))
-        if type_name in self.serialise_to:
-            func_type = self.build_type(self.serialise_to[type_name][1])
+        serialise_to = self.serialise_to.get(type_name)
+        if serialise_to is not None:
+            func_type = self.build_type(serialise_to[1])
             #enum.set_serialise_to_func(func_type)
-        if type_name in self.parse_from:
-            func_type = self.build_type(self.parse_from[type_name][1])
+        parse_from = self.parse_from.get(type_name)
+        if parse_from is not None:
+            func_type = self.build_type(parse_from[1])
             #enum.set_parse_from_func(func_type)
         return enum
 
     def build_function(self, type_name):
         name = type_name
-        parameters = []
-        for param_name, param_type_name in self.functions[type_name][1]:
-            param_type = self.build_type(valid_type_name_convertor(param_type_name))
-            parameters.append(npt.protocol.Parameter(param_name, param_type))
+        parameters = [npt.protocol.Parameter(param_name, self.build_type(valid_type_name_convertor(param_type_name)))
+                      for param_name, param_type_name in self.functions[type_name][1]]
         function = self.proto.add_type(npt.protocol.Function(name, parameters, self.build_type(valid_type_name_convertor(self.functions[type_name][2]))))
         return function
 
     def build_type(self, type_name):
+        built_type = self.types.get(type_name)
+        if built_type is not None:
+            return built_type
         if self.proto.has_type(type_name):
-            return self.proto.get_type(type_name)
+            built_type = self.proto.get_type(type_name)
         elif type_name in self.structs:
-            return self.build_struct(type_name)
+            built_type = self.build_struct(type_name)
         elif type_name in self.enums:
-            return self.build_enum(type_name)
+            built_type = self.build_enum(type_name)
         elif type_name in self.functions:
-            return self.build_function(type_name)
-        elif type_name == "Number":
-            return npt.protocol.Number()
-        elif type_name == "Boolean":
-            return npt.protocol.Boolean()
-        elif type_name == "Nothing":
-            return npt.protocol.Nothing()
+            built_type = self.build_function(type_name)
+        elif type_name in PRIMITIVE_TYPES:
+            built_type = PRIMITIVE_TYPES[type_name]()
         else:
             raise Exception("Unknown type: %s" % (type_name))
+        self.types[type_name] = built_type
+        return built_type
 
     def build_protocol(self, proto: Optional[npt.protocol.Protocol], input: Union[str, rfc.RFC], name: str=None) -> npt.protocol.Protocol:
         # if a Protocol hasn't been passed in, then instantiate one
@@ -397,11 +551,9 @@ class AsciiDiagramsParser(Parser):
         parser = self.build_parser()
 
         # find matching preambles
-        structs : List[npt.protocol.Struct]= []
-
         if isinstance(input, rfc.RFC):
             for section in input.middle.content:
-                self.process_section(section, parser, structs)
+                self.process_section(section, parser)
 
         for pdu_name in self.pdus:
             self.build_type(pdu_name)
@@ -28,7 +28,9 @@
 # SPDX-License-Identifier: BSD-2-Clause
 # =================================================================================================
 
+import os
 import sys
+import functools
 import parsley
 import string
 
@@ -37,6 +39,8 @@ import npt.parser_rfc_postprocess as domProcess
 
 from typing import Dict, List
 
+GRAMMAR_FILE = os.path.join(os.path.dirname(__file__), "grammar_rfc.txt")
+
 def depaginate(lines : List[str]) -> List[str]:
     depaginated_lines = []
     for i in range(len(lines)):
@@ -84,6 +88,7 @@ def get_ipr_code(text):
 def infer_toc(alpha:str, num:str):
     return 3
 
+@functools.lru_cache(maxsize=None)
 def generate_parser(grammarFilename):
     with open(grammarFilename) as grammarFile:
         return parsley.makeGrammar(grammarFile.read(),
@@ -102,7 +107,7 @@ def generate_parser(grammarFilename):
 def parse_rfc(rfcTxt: List[str]):
     rfcTxt = depaginate(rfcTxt)
     rfcTxt = trim_blank_lines(rfcTxt)
-    parser = generate_parser("npt/grammar_rfc.txt")
+    parser = generate_parser(GRAMMAR_FILE)
     rfc = parser("".join(rfcTxt)).rfc()
     rfc = domProcess.text_to_dl(rfc, {'tab': ''.join( parser('   ').tab())})
     return rfc
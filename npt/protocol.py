@@ -40,6 +40,9 @@ import re
 TYPE_NAME_REGEX = "^[A-Z][A-Za-z0-9$_]+$"
 FUNC_NAME_REGEX = "^[a-z][A-Za-z0-9$_]+$"
 
+_TYPE_NAME_RE = re.compile(TYPE_NAME_REGEX)
+_FUNC_NAME_RE = re.compile(FUNC_NAME_REGEX)
+
 # =================================================================================================
 # Type errors:
 
@@ -47,6 +50,23 @@ class ProtocolTypeError(Exception):
     def __init__(self, reason):
         self.reason = reason
 
+# =================================================================================================
+# Frozen dataclasses with __slots__:
+
+class _FrozenSlots:
+    """
+    Mixin for frozen dataclasses that declare __slots__. The default slot state restore assigns
+    with setattr(), which a frozen dataclass rejects, so copy and pickle need these instead.
+    """
+    __slots__ = ()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for cls in type(self).__mro__ for name in getattr(cls, "__slots__", ())}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
 # =================================================================================================
 # Traits:
 
@@ -139,7 +159,9 @@ class NumberRepresentable(Trait):
 # =================================================================================================
 # Expressions as defined in Section 3.4 of the IR specification:
 
-class Expression(ABC):
+class Expression(_FrozenSlots, ABC):
+    __slots__ = ()
+
     @abstractmethod
     def result_type(self, containing_type: Optional["ProtocolType"]) -> "ProtocolType":
         """ Expression is an abstract class whose sub-classes must implement result_type() """
@@ -147,6 +169,8 @@ class Expression(ABC):
 
 @dataclass(frozen=True)
 class ArgumentExpression(Expression):
+    __slots__ = ("arg_name", "arg_value")
+
     arg_name: str
     arg_value: Expression
 
@@ -156,12 +180,14 @@ class ArgumentExpression(Expression):
 
 @dataclass(frozen=True)
 class MethodInvocationExpression(Expression):
+    __slots__ = ("target", "method_name", "arg_exprs")
+
     target      : Expression
     method_name : str
     arg_exprs   : List[ArgumentExpression]
 
     def __post_init__(self):
-        if re.search(FUNC_NAME_REGEX, self.method_name) == None:
+        if _FUNC_NAME_RE.match(self.method_name) is None:
             raise ProtocolTypeError("Method {}: invalid name".format(self.method_name))
 
     def result_type(self, containing_type: Optional["ProtocolType"]) -> "ProtocolType":
@@ -178,6 +204,8 @@ class MethodInvocationExpression(Expression):
 
 @dataclass(frozen=True)
 class FunctionInvocationExpression(Expression):
+    __slots__ = ("func", "arg_exprs")
+
     func      : "Function"
     arg_exprs : List[ArgumentExpression]
 
@@ -196,19 +224,23 @@ class FieldAccessExpression(Expression):
     An expression representing access to `field` of `target`.
     The `target` must be a structure type.
     """
+    __slots__ = ("target", "field_name")
+
     target     : Expression
     field_name : str
 
     def result_type(self, containing_type: Optional["ProtocolType"]) -> "ProtocolType":
-        if isinstance(self.target.result_type(containing_type), Struct):
-            struct = cast(Struct, self.target.result_type(containing_type))
-            return struct.field(self.field_name).field_type
+        target_type = self.target.result_type(containing_type)
+        if isinstance(target_type, Struct):
+            return target_type.field(self.field_name).field_type
         else:
-            raise ProtocolTypeError(f"Cannot access fields in object of type {self.target.result_type(containing_type)}")
+            raise ProtocolTypeError(f"Cannot access fields in object of type {target_type}")
 
 
 @dataclass(frozen=True)
 class ContextAccessExpression(Expression):
+    __slots__ = ("context", "field_name")
+
     context    : "Context"
     field_name : str
 
@@ -218,6 +250,8 @@ class ContextAccessExpression(Expression):
 
 @dataclass(frozen=True)
 class IfElseExpression(Expression):
+    __slots__ = ("condition", "if_true", "if_false")
+
     condition : Expression
     if_true   : Expression
     if_false  : Expression
@@ -226,13 +260,16 @@ class IfElseExpression(Expression):
         result_type = self.condition.result_type(containing_type)
         if result_type != Boolean():
             raise ProtocolTypeError("Cannot create IfElseExpression: condition is not boolean")
-        if self.if_true.result_type(containing_type) != self.if_false.result_type(containing_type):
+        true_type = self.if_true.result_type(containing_type)
+        if true_type != self.if_false.result_type(containing_type):
             raise ProtocolTypeError("Cannot create IfElseExpression: branch types differ")
-        return self.if_true.result_type(containing_type)
+        return true_type
 
 
 @dataclass(frozen=True)
 class SelfExpression(Expression):
+    __slots__ = ()
+
     def result_type(self, containing_type: Optional["ProtocolType"]) -> "ProtocolType":
         if containing_type is None:
             raise ProtocolTypeError("Cannot evaluate Self expression result type without a containing type")
@@ -241,6 +278,8 @@ class SelfExpression(Expression):
 
 @dataclass(frozen=True)
 class ConstantExpression(Expression):
+    __slots__ = ("constant_type", "constant_value")
+
     constant_type  : "ProtocolType"
     constant_value : Any
 
@@ -275,29 +314,26 @@ class ProtocolType:
                 else:
                     mimpl_name = method.name
                     mimpl_rt   = method.return_type if not isinstance(method.return_type, TypeVariable) else type_variables[method.return_type]
-                    mimpl_parameters = [Parameter(p.param_name, p.param_type if not isinstance(p.param_type, TypeVariable) else type_variables[p.param_type]) for p in method.parameters]
+                    mimpl_parameters = [p if not isinstance(p.param_type, TypeVariable) else Parameter(p.param_name, type_variables[p.param_type]) for p in method.parameters]
                     self.methods[method.name] = Function(mimpl_name, mimpl_parameters, mimpl_rt)
             self.traits.append(trait)
 
     def get_method(self, method_name: str) -> "Function":
-        method = None
-        current_type = self
-        while method is None:
-            method = current_type.methods.get(method_name, None)
-            if current_type.parent is not None:
-                current_type = current_type.parent
-            else:
-                break
-        if method is None:
-            raise ProtocolTypeError(f"{self} and its parents do not implement the {method_name} method")
-        return method
+        current_type : Optional[ProtocolType] = self
+        while current_type is not None:
+            method = current_type.methods.get(method_name)
+            if method is not None:
+                return method
+            current_type = current_type.parent
+        raise ProtocolTypeError(f"{self} and its parents do not implement the {method_name} method")
 
     def is_a(self, obj):
-        parents = []
-        while self.parent is not None:
-            parents.append(self.parent)
-            self = self.parent
-        return obj in parents
+        parent = self.parent
+        while parent is not None:
+            if parent is obj or parent == obj:
+                return True
+            parent = parent.parent
+        return False
 
     def __str__(self):
         return f"{type(self).__name__}<::{' '.join([trait.name for trait in self.traits])}>"
@@ -310,10 +346,12 @@ class Singleton(type):
     _instances : Dict["Singleton", "Singleton"] = {}
 
     def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
-            cls._instances[cls].__post_init__()
-        return cls._instances[cls]
+        instance = cls._instances.get(cls)
+        if instance is None:
+            instance = super(Singleton, cls).__call__(*args, **kwargs)
+            cls._instances[cls] = instance
+            instance.__post_init__()
+        return instance
 
     def __post_init__(self):
         pass
@@ -349,7 +387,7 @@ class ConstructableType(ProtocolType):
         self._validate_typename()
 
     def _validate_typename(self):
-        if re.search(TYPE_NAME_REGEX, self.name) is None:
+        if _TYPE_NAME_RE.match(self.name) is None:
             raise ProtocolTypeError(f"Cannot create type {self.name}: malformed name")
 
     def __str__(self):
@@ -443,13 +481,15 @@ class Array(RepresentableType, ConstructableType):
 
 
 class StructField():
+    __slots__ = ("field_name", "field_type", "is_present")
+
     field_name: str
     field_type: "RepresentableType"
     is_present: Expression
 
     def __init__(self, field_name: str, field_type: "RepresentableType", is_present: Optional[Expression] = None):
         self.field_name = field_name
-        if re.search(FUNC_NAME_REGEX, field_name) is None:
+        if _FUNC_NAME_RE.match(field_name) is None:
             raise ProtocolTypeError(f"Cannot create field {field_name}: malformed name")
         self.field_type = field_type
         if is_present is not None:
@@ -491,19 +531,22 @@ class Struct(RepresentableType, ConstructableType):
         self.fields[field.field_name] = field
 
     def add_constraint(self, constraint: Expression) -> None:
-        if constraint.result_type(self) != Boolean():
-            raise ProtocolTypeError(f"Invalid constraint: {constraint.result_type(self)} != Boolean")
+        result_type = constraint.result_type(self)
+        if result_type != Boolean():
+            raise ProtocolTypeError(f"Invalid constraint: {result_type} != Boolean")
         self.constraints.append(constraint)
 
     def add_action(self, action: Expression) -> None:
-        if action.result_type(self) != Nothing():
-            raise ProtocolTypeError(f"Invalid action: {action.result_type(self)} != Nothing")
+        result_type = action.result_type(self)
+        if result_type != Nothing():
+            raise ProtocolTypeError(f"Invalid action: {result_type} != Nothing")
         self.actions.append(action)
 
     def field(self, field_name: str) -> StructField:
-        if field_name not in self.fields:
+        field = self.fields.get(field_name)
+        if field is None:
             raise ProtocolTypeError(f"{self.name} has no field named {field_name}")
-        return self.fields[field_name]
+        return field
 
     def get_fields(self) -> List[StructField]:
         return list(self.fields.values())
@@ -542,13 +585,17 @@ class Number(PrimitiveType, InternalType):
 # Internal, constructable types:
 
 @dataclass(frozen=True)
-class Parameter:
+class Parameter(_FrozenSlots):
+    __slots__ = ("param_name", "param_type")
+
     param_name : str
     param_type : Union[ProtocolType, TypeVariable]
 
 
 @dataclass(frozen=True)
-class Argument:
+class Argument(_FrozenSlots):
+    __slots__ = ("arg_name", "arg_type", "arg_value")
+
     arg_name  : str
     arg_type  : Union[ProtocolType, TypeVariable]
     arg_value : Any
@@ -564,22 +611,27 @@ class Function(InternalType, ConstructableType):
         self.return_type = return_type
 
     def _validate_typename(self):
-        if re.search(FUNC_NAME_REGEX, self.name) is None:
+        if _FUNC_NAME_RE.match(self.name) is None:
             raise ProtocolTypeError(f"Cannot create type {self.name}: malformed name")
 
     def is_method(self) -> bool:
         return self.parameters[0].param_name == "self"
 
+    def _accepts_argument(self, p: Parameter, arg_name: str, arg_type: Union[ProtocolType, TypeVariable]) -> bool:
+        if isinstance(p.param_type, TypeVariable):
+            raise ProtocolTypeError(f"Cannot evaluate signature of Function {self.name}: unresolved type variables")
+        if (p.param_name != arg_name):
+            return False
+        if (p.param_type != arg_type) and not isinstance(arg_type, TypeVariable) and not arg_type.is_a(p.param_type):
+            return False
+        return True
+
     def accepts_arguments(self, arguments: List[Argument]) -> bool:
         """
         Check if this function accepts the specified arguments
         """
         for (p, a) in zip(self.parameters, arguments):
-            if isinstance(p.param_type, TypeVariable):
-                raise ProtocolTypeError(f"Cannot evaluate signature of Function {self.name}: unresolved type variables")
-            if (p.param_name != a.arg_name):
-                return False
-            if (p.param_type != a.arg_type) and not isinstance(a.arg_type, TypeVariable) and not a.arg_type.is_a(p.param_type):
+            if not self._accepts_argument(p, a.arg_name, a.arg_type):
                 return False
         return True
 
@@ -588,7 +640,12 @@ class Function(InternalType, ConstructableType):
         Check if this function is a method and accepts the specified arguments when invoked on an
         object of type self_type
         """
-        return self.is_method() and self.accepts_arguments([Argument("self", self_type, TypeVariable("T"))] + arguments)
+        if not self.is_method() or not self._accepts_argument(self.parameters[0], "self", self_type):
+            return False
+        for (p, a) in zip(self.parameters[1:], arguments):
+            if not self._accepts_argument(p, a.arg_name, a.arg_type):
+                return False
+        return True
 
     def get_return_type(self) -> Union[ProtocolType, TypeVariable]:
         return self.return_type
@@ -598,7 +655,9 @@ class Function(InternalType, ConstructableType):
 
 
 @dataclass(frozen=True)
-class ContextField():
+class ContextField(_FrozenSlots):
+    __slots__ = ("field_name", "field_type")
+
     field_name : str
     field_type : ProtocolType
 
@@ -616,9 +675,10 @@ class Context(InternalType, ConstructableType):
         self.fields[field.field_name] = field
 
     def field(self, field_name: str) -> ContextField:
-        if field_name not in self.fields:
+        field = self.fields.get(field_name)
+        if field is None:
             raise ProtocolTypeError(f"{self.name} has no field named {field_name}")
-        return self.fields[field_name]
+        return field
 
     def get_fields(self) -> List[ContextField]:
         return list(self.fields.values())
@@ -681,13 +741,12 @@ class Protocol(InternalType, ConstructableType):
           self  - the protocol in which the new type is defined
           pdu   - the name of a pre-existing type that is a PDU
         """
-        assert pdu in self._types
-        assert isinstance(self._types[pdu], RepresentableType)
+        assert isinstance(self._types.get(pdu), RepresentableType)
         self._pdus.append(pdu)
 
     def synthesise(self) -> None:
         for ptype in self._types.values():
-            if isinstance(ptype, Struct) or isinstance(ptype, Array) or isinstance(ptype, Enum):
+            if isinstance(ptype, (Struct, Array, Enum)):
                 if ptype.parse_from is None:
                     pf_func = Function(f"parse_to_{ptype.name.lower()}",
                                         [Parameter("from", self.get_type("DataUnit"))],
@@ -725,8 +784,9 @@ class Protocol(InternalType, ConstructableType):
         return type_name in self._types
 
     def get_type(self, type_name: str) -> ConstructableType:
-        assert self.has_type(type_name)
-        return self._types[type_name]
+        ptype = self._types.get(type_name)
+        assert ptype is not None
+        return ptype
 
     def has_func(self, func_name: str) -> bool:
         return func_name in self._funcs
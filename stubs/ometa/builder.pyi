@@ -0,0 +1,4 @@
+from typing import Any
+
+def writePython(tree: Any, txt: Any) -> str: ...
+def moduleFromGrammar(source: Any, className: Any, modname: Any, filename: Any): ...
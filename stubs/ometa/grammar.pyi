@@ -0,0 +1,5 @@
+from typing import Any
+
+class OMeta:
+    def __init__(self, input: Any, *args: Any, **kwargs: Any) -> None: ...
+    def parseGrammar(self, name: Any): ...
@@ -0,0 +1,5 @@
+from typing import Any
+
+class OMetaBase:
+    globals: Any = ...
+    def __init__(self, input: Any, *args: Any, **kwargs: Any) -> None: ...
@@ -29,8 +29,11 @@
 # =================================================================================================
 
 import os
+import shutil
 import sys
+import tempfile
 import unittest
+import unittest.mock
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -42,6 +45,7 @@ from npt.protocol import *
 import npt.rfc as rfc
 import npt.parser_rfc_txt
 import npt.parser_rfc_xml
+import npt.parser_asciidiagrams
 
 from npt.parser               import Parser
 from npt.parser_asciidiagrams import AsciiDiagramsParser
@@ -59,3 +63,91 @@ class TestParsers(unittest.TestCase):
         self.assertEqual(protocol.get_protocol_name(),  "Example")
         self.assertEqual(len(protocol.get_pdu_names()), 4)
         #TODO
+
+    def test_asciidiagram_parser_reuses_grammar(self):
+        with unittest.mock.patch.dict(npt.parser_asciidiagrams._grammar_cache, clear=True), \
+             unittest.mock.patch("npt.parser_asciidiagrams.moduleFromGrammar",
+                                 wraps=npt.parser_asciidiagrams.moduleFromGrammar) as moduleFromGrammar:
+            first  = AsciiDiagramsParser().build_protocol(None, self.content)
+            second = AsciiDiagramsParser().build_protocol(None, self.content)
+        self.assertEqual(moduleFromGrammar.call_count, 1)
+        self.assertEqual(first.get_type_names(), second.get_type_names())
+
+
+    def test_asciidiagram_paragraph_markers(self):
+        # One sample per alternative of the paragraph rule: each must pass the PARAGRAPH_MARKERS
+        # prefilter, or process_section() would skip it without running the parser.
+        samples = {
+            "A Test Packet is formatted as follows:"
+                : ("preamble", "Test Packet"),
+            "The apply_protection function is defined as:"
+                : ("function", "apply_protection"),
+            "A Frame is either a PING Frame or a HANDSHAKE_DONE Frame."
+                : ("enum", ("Frame", ["PING Frame", "HANDSHAKE_DONE Frame"])),
+            "A Frame is one of: a PING Frame, a HANDSHAKE_DONE Frame, or an ACK Frame."
+                : ("enum", ("Frame", ["PING Frame", "HANDSHAKE_DONE Frame", "ACK Frame"])),
+            "A Plain Packet is serialised to a Protected Packet using the apply_protection function."
+                : ("serialised_to", ("Plain Packet", "Protected Packet", "apply_protection")),
+            "A Plain Packet is parsed from a Protected Packet using the remove_protection function."
+                : ("parsed_from", ("Protected Packet", "Plain Packet", "remove_protection")),
+            "This document describes the Example protocol. The Example protocol uses Long Headers, and RTP Data Packets."
+                : ("protocol_definition", ("Example", ["Long Header", "RTP Data Packet"])),
+        }
+        ascii_diagram_parser = AsciiDiagramsParser()
+        ascii_diagram_parser.proto = Protocol()
+        parser = ascii_diagram_parser.build_parser()
+        for text, expected in samples.items():
+            with self.subTest(text=text):
+                self.assertTrue(any(marker in text for marker in npt.parser_asciidiagrams.PARAGRAPH_MARKERS))
+                self.assertEqual(parser(text).paragraph(), expected)
+
+
+class TestGrammarCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.grammar_file = os.path.join(self.tmpdir.name, "grammar_asciidiagrams.txt")
+        self.cache_file = os.path.join(self.tmpdir.name, "__pycache__", "grammar_asciidiagrams.txt.py")
+        shutil.copy(npt.parser_asciidiagrams.GRAMMAR_FILE, self.grammar_file)
+        self.source = npt.parser_asciidiagrams.grammar_source(self.grammar_file)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_grammar_cache_hit(self):
+        with unittest.mock.patch("npt.parser_asciidiagrams.writePython") as writePython:
+            source = npt.parser_asciidiagrams.grammar_source(self.grammar_file)
+        writePython.assert_not_called()
+        self.assertEqual(source, self.source)
+
+    def test_grammar_cache_stale_digest(self):
+        with open(self.cache_file, "w") as cacheFile:
+            cacheFile.write("# stale\n" + "garbage\n")
+        source = npt.parser_asciidiagrams.grammar_source(self.grammar_file)
+        self.assertEqual(source, self.source)
+        with open(self.cache_file) as cacheFile:
+            cacheFile.readline()
+            self.assertEqual(cacheFile.read(), self.source)
+
+    def test_grammar_cache_corrupt_file(self):
+        with open(self.cache_file, "r+") as cacheFile:
+            cacheFile.truncate(5000)
+        grammar = npt.parser_asciidiagrams.load_grammar(self.grammar_file, {})
+        self.assertEqual(grammar("A Test Packet is formatted as follows:").paragraph(), ("preamble", "Test Packet"))
+        with open(self.cache_file) as cacheFile:
+            cacheFile.readline()
+            self.assertEqual(cacheFile.read(), self.source)
+        self.assertEqual(os.listdir(os.path.dirname(self.cache_file)), ["grammar_asciidiagrams.txt.py"])
+
+    def test_grammar_cache_failed_write(self):
+        # A lone surrogate cannot be encoded, so writing the temporary file fails part way
+        with unittest.mock.patch("npt.parser_asciidiagrams.writePython", return_value="\udc80"):
+            source = npt.parser_asciidiagrams.grammar_source(self.grammar_file, use_cache=False)
+        self.assertEqual(source, "\udc80")
+        self.assertEqual(os.listdir(os.path.dirname(self.cache_file)), ["grammar_asciidiagrams.txt.py"])
+
+    def test_grammar_cache_without_generator_version(self):
+        os.remove(self.cache_file)
+        with unittest.mock.patch("npt.parser_asciidiagrams.GENERATOR_VERSION", None):
+            source = npt.parser_asciidiagrams.grammar_source(self.grammar_file)
+        self.assertEqual(source, self.source)
+        self.assertFalse(os.path.exists(self.cache_file))
@@ -28,7 +28,9 @@
 # SPDX-License-Identifier: BSD-2-Clause
 # =================================================================================================
 
+import copy
 import os
+import pickle
 import sys
 import unittest
 
@@ -453,6 +455,22 @@ class TestProtocol(unittest.TestCase):
         self.assertEqual(constant_expression.constant_value, 1)
         self.assertEqual(constant_expression.result_type(None), Number())
 
+
+    def test_expression_copy_pickle(self):
+        expr = ArgumentExpression("other", FieldAccessExpression(SelfExpression(), "xx"))
+
+        self.assertEqual(copy.copy(expr), expr)
+        self.assertEqual(copy.deepcopy(expr), expr)
+        self.assertEqual(pickle.loads(pickle.dumps(expr)), expr)
+
+
+    def test_constant_expression_copy_pickle(self):
+        expr = ConstantExpression(Number(), 1)
+
+        self.assertEqual(copy.copy(expr), expr)
+        self.assertEqual(copy.deepcopy(expr), expr)
+        self.assertEqual(pickle.loads(pickle.dumps(expr)), expr)
+
     # =============================================================================================
     # Test cases for protocol types:
 
@@ -1191,6 +1209,24 @@ class TestProtocol(unittest.TestCase):
 
         self.assertTrue(context.get_fields(), [cf])
 
+
+    def test_internal_records_copy_pickle(self):
+        records = [Parameter("xx", Number()), Argument("xx", Number(), 1), ContextField("xx", Number())]
+
+        for record in records:
+            self.assertEqual(copy.copy(record), record)
+            self.assertEqual(copy.deepcopy(record), record)
+            self.assertEqual(pickle.loads(pickle.dumps(record)), record)
+
+
+    def test_structfield_pickle(self):
+        field = StructField("xx", Nothing())
+        unpickled = pickle.loads(pickle.dumps(field))
+
+        self.assertEqual(unpickled.field_name, "xx")
+        self.assertEqual(unpickled.field_type, Nothing())
+        self.assertEqual(unpickled.is_present, field.is_present)
+
 # =================================================================================================
 if __name__ == "__main__":
     unittest.main()